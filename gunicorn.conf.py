@@ -0,0 +1,22 @@
+"""
+Gunicorn configuration for the Spotify Audio Features Backend
+Run with: gunicorn -c gunicorn.conf.py spotify_backend:app
+"""
+
+import os
+from multiprocessing import cpu_count
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5050)}"
+
+# Threaded workers so slow Spotify calls don't block other incoming requests
+worker_class = "gthread"
+workers = int(os.getenv('WEB_CONCURRENCY', 2 * cpu_count()))
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+
+keepalive = 75
+timeout = 30
+
+# Log to stdout/stderr
+accesslog = "-"
+errorlog = "-"
+loglevel = "info"
@@ -5,11 +5,26 @@ A Flask API that fetches audio features and analysis from Spotify Web API
 """
 
 import os
-import json
+import sys
+import orjson
+import ijson
 import base64
+import time
+import uuid
+import re
+import itertools
+import threading
 import requests
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+import redis
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from functools import lru_cache
+from urllib.parse import urlencode
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import JSONProvider
+from flask_compress import Compress
 from datetime import datetime, timedelta
 import logging
 from dotenv import load_dotenv
@@ -21,8 +36,18 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson for faster (de)serialization"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode("utf-8")
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+app.json = OrjsonProvider(app)
+Compress(app)  # gzip/brotli responses for clients that accept it
 
 # Spotify API Configuration
 SPOTIFY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID')
@@ -32,19 +57,167 @@ if not SPOTIFY_CLIENT_ID or not SPOTIFY_CLIENT_SECRET:
     raise ValueError("Please set SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET in .env file")
 
 SPOTIFY_API_BASE = 'https://api.spotify.com/v1'
+SPOTIFY_API_PREFIX = SPOTIFY_API_BASE + '/'
 SPOTIFY_TOKEN_URL = 'https://accounts.spotify.com/api/token'
 
-# In-memory token storage (use Redis/database in production)
+# Shared pool for fanning out Spotify calls; sized to stay well within
+# Spotify's rate limits while letting concurrent requests overlap
+EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv('SPOTIFY_MAX_WORKERS', 32)))
+
+# Persistent session so keep-alive connections (and their TLS handshakes)
+# are reused across requests instead of reconnecting on every call
+# (connect, read) timeouts for every Spotify call so a hung connection
+# can't hold a worker thread (or the requests coalesced behind it) forever
+SPOTIFY_TIMEOUT = (3.05, 10)
+
+# Retry budget: at most SPOTIFY_RETRIES extra attempts, each waiting no longer
+# than SPOTIFY_RETRY_AFTER_MAX (a 429's Retry-After is capped to this;
+# exponential backoff at 0.2s stays well below it)
+SPOTIFY_RETRIES = 2
+SPOTIFY_RETRY_AFTER_MAX = 5
+
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(
+        total=SPOTIFY_RETRIES,
+        backoff_factor=0.2,
+        status_forcelist=[429, 502, 503, 504],
+        retry_after_max=SPOTIFY_RETRY_AFTER_MAX
+    )
+))
+
+# Optional Redis cache for Spotify responses; caching is skipped when REDIS_URL is unset
+REDIS_URL = os.getenv('REDIS_URL')
+redis_client = redis.Redis(connection_pool=redis.ConnectionPool.from_url(REDIS_URL)) if REDIS_URL else None
+
+# Cache TTLs (seconds) by endpoint prefix; audio features/analysis never change for a track
+CACHE_TTLS = {
+    "audio-features/": 86400 * 30,
+    "audio-analysis/": 86400 * 30,
+    "tracks/": 3600,
+    "search?": 300,
+}
+
+# Cap on /batch/features IDs (4 bulk calls) so one request can't monopolise EXECUTOR
+MAX_BATCH_IDS = 200
+
+# How long to keep ETags (and their bodies) for revalidating expired cache entries
+ETAG_TTL = 86400 * 7
+
+# Endpoints worth revalidating with ETags: track info expires from the cache
+# well before ETAG_TTL. Features/analysis outlive it and search keys are too
+# numerous and short-lived to be worth a second copy of the body.
+ETAG_ENDPOINTS = ("tracks/",)
+
+# Matches a track ID in a bare ID, open.spotify.com URL or spotify:track: URI
+TRACK_ID_PATTERN = re.compile(r'(?:https?://open\.spotify\.com/track/|spotify:track:)?([A-Za-z0-9]{22})(?:\?.*)?')
+
+# Timed arrays in an audio analysis; /complete only reports how many each has
+ANALYSIS_ARRAYS = ("bars", "beats", "sections", "segments", "tatums")
+
+# In-process token storage; when Redis is configured the token is shared
+# across all workers instead and these act as a local fallback
 access_token = None
 token_expires_at = None
 
-def get_spotify_token():
-    """Get access token using client credentials flow"""
+token_lock = threading.Lock()
+
+TOKEN_CACHE_KEY = "spotify:access_token"
+TOKEN_LOCK_KEY = "spotify:token_lock"
+
+# Deletes the lock only if we still own it, so a refresh that outlives the
+# lock's expiry can't release a lock another worker has since taken
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+def get_shared_token():
+    """Return the access token cached in Redis, if any.
+    
+    The token is also kept in-process until its Redis TTL runs out, so later
+    calls in this worker don't need to ask Redis again.
+    """
     global access_token, token_expires_at
     
-    # Check if token is still valid
+    if not redis_client:
+        return None
+    try:
+        pipe = redis_client.pipeline()
+        pipe.get(TOKEN_CACHE_KEY)
+        pipe.ttl(TOKEN_CACHE_KEY)
+        token, ttl = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Redis token read failed: {e}")
+        return None
+    if not token:
+        return None
+    
+    access_token = token.decode("utf-8")
+    token_expires_at = datetime.now() + timedelta(seconds=max(ttl, 0))
+    return access_token
+
+def acquire_token_lock():
+    """Try to become the one worker that refreshes the token.
+    
+    If another worker holds the lock, wait briefly for it to publish the new
+    token and return it. Returns (lock_id, token); lock_id is set only when
+    we acquired the lock and must be passed to release_token_lock.
+    """
+    if not redis_client:
+        return None, None
+    lock_id = uuid.uuid4().hex
+    try:
+        if redis_client.set(TOKEN_LOCK_KEY, lock_id, nx=True, ex=10):
+            return lock_id, None
+        for _ in range(50):
+            time.sleep(0.1)
+            token = get_shared_token()
+            if token:
+                return None, token
+    except redis.RedisError as e:
+        logger.warning(f"Redis token lock failed: {e}")
+    # Lock holder is slow or Redis is unavailable, fetch our own token
+    return None, None
+
+def release_token_lock(lock_id):
+    """Release the token lock if it is still held by lock_id"""
+    try:
+        redis_client.eval(RELEASE_LOCK_SCRIPT, 1, TOKEN_LOCK_KEY, lock_id)
+    except redis.RedisError as e:
+        logger.warning(f"Redis token unlock failed: {e}")
+
+def get_local_token():
+    """Return the in-process access token if it hasn't expired"""
     if access_token and token_expires_at and datetime.now() < token_expires_at:
         return access_token
+    return None
+
+def get_spotify_token():
+    """Get access token using client credentials flow"""
+    # Use our own cached token first; only go to Redis once it has expired
+    token = get_local_token() or get_shared_token()
+    if token:
+        return token
+    
+    # Only one thread per process refreshes; the rest wait and reuse its token
+    with token_lock:
+        token = get_local_token() or get_shared_token()
+        if token:
+            return token
+        return refresh_spotify_token()
+
+def refresh_spotify_token():
+    """Request a new access token from Spotify and store it"""
+    global access_token, token_expires_at
+    
+    lock_id, token = acquire_token_lock()
+    if token:
+        return token
     
     # Get new token
     auth_string = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}"
@@ -60,74 +233,316 @@ def get_spotify_token():
     
     try:
         logger.info(f"Attempting to get Spotify token with Client ID: {SPOTIFY_CLIENT_ID[:5]}...")
-        response = requests.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
+        response = SESSION.post(SPOTIFY_TOKEN_URL, headers=headers, data=data, timeout=SPOTIFY_TIMEOUT)
         
         if response.status_code != 200:
             logger.error(f"Spotify token request failed with status {response.status_code}")
             logger.error(f"Response content: {response.text}")
             response.raise_for_status()
         
-        token_data = response.json()
+        token_data = orjson.loads(response.content)
         access_token = token_data["access_token"]
         expires_in = token_data["expires_in"]
         token_expires_at = datetime.now() + timedelta(seconds=expires_in - 60)  # 60s buffer
         
+        if redis_client:
+            try:
+                redis_client.set(TOKEN_CACHE_KEY, access_token, ex=expires_in - 60)
+            except redis.RedisError as e:
+                logger.warning(f"Redis token write failed: {e}")
+        
         logger.info("Successfully obtained Spotify access token")
         return access_token
         
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         logger.error(f"Failed to get Spotify token: {str(e)}")
-        if hasattr(e.response, 'text'):
+        if getattr(e, 'response', None) is not None:
             logger.error(f"Error response: {e.response.text}")
         return None
+    
+    finally:
+        if lock_id:
+            release_token_lock(lock_id)
 
-def make_spotify_request(endpoint):
-    """Make authenticated request to Spotify API"""
+def cache_ttl(endpoint):
+    """Return the cache TTL for an endpoint, or None if it shouldn't be cached"""
+    for prefix, ttl in CACHE_TTLS.items():
+        if endpoint.startswith(prefix):
+            return ttl
+    return None
+
+def cache_get(cache_key):
+    """Return the cached bytes for a key, or None on a miss or Redis error"""
+    if not redis_client:
+        return None
+    try:
+        return redis_client.get(cache_key)
+    except redis.RedisError as e:
+        logger.warning(f"Redis cache read failed: {e}")
+        return None
+
+def cache_set(cache_key, value, ttl):
+    """Store bytes in the cache, ignoring Redis errors"""
+    if not redis_client:
+        return
+    try:
+        redis_client.set(cache_key, value, ex=ttl)
+    except redis.RedisError as e:
+        logger.warning(f"Redis cache write failed: {e}")
+
+# Spotify fetches currently in flight, keyed by cache key, so concurrent
+# requests for the same resource share one upstream call
+inflight_requests = {}
+inflight_lock = threading.Lock()
+
+# How long a coalesced caller waits for the in-flight fetch: every attempt
+# hitting both timeouts plus the longest sleep between attempts, with a
+# second of slack. A body that keeps trickling in under the read timeout
+# can still outlast this, in which case the waiter gives up with None.
+SINGLE_FLIGHT_TIMEOUT = (
+    (SPOTIFY_RETRIES + 1) * sum(SPOTIFY_TIMEOUT)
+    + SPOTIFY_RETRIES * SPOTIFY_RETRY_AFTER_MAX
+    + 1
+)
+
+def single_flight(key, fetch, *args):
+    """Call fetch(*args), or wait for the identical call already in progress"""
+    with inflight_lock:
+        future = inflight_requests.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = inflight_requests[key] = Future()
+    
+    if not is_leader:
+        try:
+            return future.result(timeout=SINGLE_FLIGHT_TIMEOUT)
+        except FuturesTimeoutError:
+            logger.error(f"Timed out waiting for in-flight request {key}")
+            return None
+    
+    try:
+        result = fetch(*args)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with inflight_lock:
+            del inflight_requests[key]
+
+def etag_get(endpoint):
+    """Return the stored (etag, body) for an endpoint, or (None, None)"""
+    if not redis_client:
+        return None, None
+    try:
+        etag, body = redis_client.hmget(f"sp:etag:{endpoint}", "etag", "body")
+    except redis.RedisError as e:
+        logger.warning(f"Redis ETag read failed: {e}")
+        return None, None
+    if not etag or not body:
+        return None, None
+    return etag.decode("utf-8"), body
+
+def etag_set(endpoint, etag, body):
+    """Remember a response's ETag and body for later conditional requests"""
+    if not redis_client:
+        return
+    etag_key = f"sp:etag:{endpoint}"
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hset(etag_key, mapping={"etag": etag, "body": body})
+        pipe.expire(etag_key, ETAG_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Redis ETag write failed: {e}")
+
+def make_spotify_request_raw(endpoint):
+    """Make authenticated request to Spotify API and return the undecoded JSON body.
+    
+    Responses are served from Redis when cached. Once the cached copy expires,
+    the request is revalidated with If-None-Match so an unchanged resource
+    comes back as a bodyless 304. Concurrent calls for the same endpoint are
+    coalesced into one. Returns None on failure.
+    """
+    return single_flight(f"sp:{endpoint}", fetch_spotify_raw, endpoint)
+
+def fetch_spotify_raw(endpoint):
+    """Fetch an endpoint's body from the cache or Spotify (see make_spotify_request_raw)"""
+    ttl = cache_ttl(endpoint)
+    cache_key = f"sp:{endpoint}"
+    
+    if ttl:
+        cached = cache_get(cache_key)
+        if cached:
+            return cached
+    
     token = get_spotify_token()
     if not token:
         return None
     
     headers = {"Authorization": f"Bearer {token}"}
-    url = f"{SPOTIFY_API_BASE}/{endpoint}"
+    url = SPOTIFY_API_PREFIX + endpoint
+    
+    use_etag = ttl and endpoint.startswith(ETAG_ENDPOINTS)
+    etag, etag_body = etag_get(endpoint) if use_etag else (None, None)
+    if etag:
+        headers["If-None-Match"] = etag
     
     try:
-        response = requests.get(url, headers=headers)
+        response = SESSION.get(url, headers=headers, timeout=SPOTIFY_TIMEOUT)
         response.raise_for_status()
-        return response.json()
     except requests.exceptions.RequestException as e:
         logger.error(f"Spotify API request failed: {e}")
         return None
+    
+    if response.status_code == 304 and etag_body:
+        content = etag_body
+    else:
+        content = response.content
+        if use_etag and response.headers.get("ETag"):
+            etag_set(endpoint, response.headers["ETag"], content)
+    
+    if ttl:
+        cache_set(cache_key, content, ttl)
+    
+    return content
+
+def make_spotify_request(endpoint):
+    """Make authenticated request to Spotify API and decode the JSON response"""
+    content = make_spotify_request_raw(endpoint)
+    if not content:
+        return None
+    
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError as e:
+        logger.error(f"Spotify API returned invalid JSON: {e}")
+        return None
 
+def summarize_audio_analysis(track_id):
+    """Get the meta/track sections and array lengths of a track's audio analysis.
+    
+    The analysis payload can be several MB (mostly segments), so it is
+    stream-parsed with ijson and only the item counts are kept instead of
+    decoding the whole document.
+    """
+    return single_flight(f"sp:audio-analysis-summary/{track_id}", fetch_audio_analysis_summary, track_id)
+
+def fetch_audio_analysis_summary(track_id):
+    """Stream and summarize an audio analysis (see summarize_audio_analysis)"""
+    cache_key = f"sp:audio-analysis-summary/{track_id}"
+    ttl = CACHE_TTLS["audio-analysis/"]
+    
+    cached = cache_get(cache_key)
+    if cached:
+        return orjson.loads(cached)
+    
+    token = get_spotify_token()
+    if not token:
+        return None
+    
+    headers = {"Authorization": f"Bearer {token}"}
+    url = SPOTIFY_API_PREFIX + "audio-analysis/" + track_id
+    
+    summary = {"meta": {}, "track": {}, **dict.fromkeys(ANALYSIS_ARRAYS, 0)}
+    item_prefixes = {f"{name}.item": name for name in ANALYSIS_ARRAYS}
+    builder = None
+    
+    try:
+        with SESSION.get(url, headers=headers, stream=True, timeout=SPOTIFY_TIMEOUT) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            for prefix, event, value in ijson.parse(response.raw, use_float=True):
+                if builder:
+                    # Collecting the small meta/track objects in full
+                    builder.event(event, value)
+                    if prefix == builder_key and event == "end_map":
+                        summary[builder_key] = builder.value
+                        builder = None
+                elif prefix in ("meta", "track") and event == "start_map":
+                    builder, builder_key = ijson.ObjectBuilder(), prefix
+                    builder.event(event, value)
+                elif prefix in item_prefixes and event in ("start_map", "start_array"):
+                    summary[item_prefixes[prefix]] += 1
+    except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError, ijson.JSONError) as e:
+        # Reading response.raw directly surfaces urllib3 errors (dropped or
+        # truncated streams) that requests would otherwise wrap
+        logger.error(f"Spotify API request failed: {e}")
+        return None
+    
+    cache_set(cache_key, orjson.dumps(summary), ttl)
+    return summary
+
+def batch_features(track_ids):
+    """Fetch audio features for many tracks using Spotify's bulk endpoint.
+    
+    IDs are sent in chunks of 50 (Spotify's per-request limit) and the chunks
+    are fetched concurrently. Returns None if any chunk fails.
+    """
+    ids = iter(track_ids)
+    chunks = iter(lambda: list(itertools.islice(ids, 50)), [])
+    futures = [
+        EXECUTOR.submit(make_spotify_request, f"audio-features?ids={','.join(chunk)}")
+        for chunk in chunks
+    ]
+    
+    features = []
+    for future in futures:
+        data = future.result()
+        if not data:
+            return None
+        features.extend(data["audio_features"])
+    return features
+
+@lru_cache(maxsize=4096)
 def extract_track_id(spotify_url_or_id):
-    """Extract track ID from Spotify URL or return if already an ID"""
-    if spotify_url_or_id.startswith('https://open.spotify.com/track/'):
-        return spotify_url_or_id.split('/')[-1].split('?')[0]
-    elif spotify_url_or_id.startswith('spotify:track:'):
-        return spotify_url_or_id.split(':')[-1]
-    else:
-        # Assume it's already a track ID
-        return spotify_url_or_id
+    """Extract track ID from a Spotify URL, URI or bare ID; None if it isn't one"""
+    match = TRACK_ID_PATTERN.fullmatch(spotify_url_or_id)
+    return match.group(1) if match else None
+
+@app.before_request
+def handle_preflight():
+    """Answer CORS preflight requests without running any route handler"""
+    if request.method == 'OPTIONS':
+        return Response(status=204)
+
+@app.after_request
+def add_cors_headers(response):
+    """Allow the API to be called from any origin"""
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Allow-Methods"] = "GET, OPTIONS"
+    response.headers["Access-Control-Allow-Headers"] = "Content-Type"
+    return response
+
+# Static responses are serialized once at import time
+HOME_BODY = orjson.dumps({
+    "message": "Spotify Audio Features API",
+    "endpoints": {
+        "/track/<track_id_or_url>": "Get basic track info",
+        "/features/<track_id_or_url>": "Get audio features for a track",
+        "/analysis/<track_id_or_url>": "Get detailed audio analysis for a track",
+        "/complete/<track_id_or_url>": "Get track info, features, and analysis combined",
+        "/batch/features?ids=<id1,id2,...>": "Get audio features for up to 200 tracks at once",
+        "/search?q=<query>": "Search for tracks"
+    },
+    "example_track_id": "4iV5W9uYEdYUVa79Axb7Rh",
+    "example_usage": "/features/4iV5W9uYEdYUVa79Axb7Rh"
+})
+NOT_FOUND_BODY = orjson.dumps({"error": "Endpoint not found"})
+INTERNAL_ERROR_BODY = orjson.dumps({"error": "Internal server error"})
 
 @app.route('/', methods=['GET'])
 def home():
     """API documentation endpoint"""
-    return jsonify({
-        "message": "Spotify Audio Features API",
-        "endpoints": {
-            "/track/<track_id_or_url>": "Get basic track info",
-            "/features/<track_id_or_url>": "Get audio features for a track",
-            "/analysis/<track_id_or_url>": "Get detailed audio analysis for a track",
-            "/complete/<track_id_or_url>": "Get track info, features, and analysis combined",
-            "/search?q=<query>": "Search for tracks"
-        },
-        "example_track_id": "4iV5W9uYEdYUVa79Axb7Rh",
-        "example_usage": "/features/4iV5W9uYEdYUVa79Axb7Rh"
-    })
+    return Response(HOME_BODY, mimetype='application/json')
 
 @app.route('/track/<track_identifier>', methods=['GET'])
 def get_track_info(track_identifier):
     """Get basic track information"""
     track_id = extract_track_id(track_identifier)
+    if not track_id:
+        return jsonify({"error": "Invalid track ID"}), 400
     
     data = make_spotify_request(f"tracks/{track_id}")
     if not data:
@@ -151,33 +566,44 @@ def get_track_info(track_identifier):
 def get_audio_features(track_identifier):
     """Get audio features for a track"""
     track_id = extract_track_id(track_identifier)
+    if not track_id:
+        return jsonify({"error": "Invalid track ID"}), 400
     
-    data = make_spotify_request(f"audio-features/{track_id}")
-    if not data:
+    # Pass Spotify's JSON through untouched rather than decoding and re-encoding it
+    content = make_spotify_request_raw(f"audio-features/{track_id}")
+    if not content:
         return jsonify({"error": "Failed to fetch audio features"}), 500
     
-    return jsonify(data)
+    return Response(content, mimetype='application/json')
 
 @app.route('/analysis/<track_identifier>', methods=['GET'])
 def get_audio_analysis(track_identifier):
     """Get detailed audio analysis for a track"""
     track_id = extract_track_id(track_identifier)
+    if not track_id:
+        return jsonify({"error": "Invalid track ID"}), 400
     
-    data = make_spotify_request(f"audio-analysis/{track_id}")
-    if not data:
+    # Pass Spotify's JSON through untouched rather than decoding and re-encoding it
+    content = make_spotify_request_raw(f"audio-analysis/{track_id}")
+    if not content:
         return jsonify({"error": "Failed to fetch audio analysis"}), 500
     
-    return jsonify(data)
+    return Response(content, mimetype='application/json')
 
 @app.route('/complete/<track_identifier>', methods=['GET'])
 def get_complete_track_data(track_identifier):
     """Get track info, audio features, and analysis combined"""
     track_id = extract_track_id(track_identifier)
+    if not track_id:
+        return jsonify({"error": "Invalid track ID"}), 400
     
-    # Fetch all data in parallel would be better, but keeping it simple
-    track_data = make_spotify_request(f"tracks/{track_id}")
-    features_data = make_spotify_request(f"audio-features/{track_id}")
-    analysis_data = make_spotify_request(f"audio-analysis/{track_id}")
+    # Fetch all three in parallel so latency is the slowest call, not the sum
+    track_future = EXECUTOR.submit(make_spotify_request, f"tracks/{track_id}")
+    features_future = EXECUTOR.submit(make_spotify_request, f"audio-features/{track_id}")
+    analysis_future = EXECUTOR.submit(summarize_audio_analysis, track_id)
+    track_data = track_future.result()
+    features_data = features_future.result()
+    analysis_data = analysis_future.result()
     
     if not all([track_data, features_data, analysis_data]):
         return jsonify({"error": "Failed to fetch complete track data"}), 500
@@ -195,19 +621,34 @@ def get_complete_track_data(track_identifier):
             "external_urls": track_data["external_urls"]
         },
         "audio_features": features_data,
-        "audio_analysis": {
-            "meta": analysis_data.get("meta", {}),
-            "track": analysis_data.get("track", {}),
-            "bars": len(analysis_data.get("bars", [])),
-            "beats": len(analysis_data.get("beats", [])),
-            "sections": len(analysis_data.get("sections", [])),
-            "segments": len(analysis_data.get("segments", [])),
-            "tatums": len(analysis_data.get("tatums", []))
-        }
+        "audio_analysis": analysis_data
     }
     
     return jsonify(complete_data)
 
+@app.route('/batch/features', methods=['GET'])
+def get_batch_audio_features():
+    """Get audio features for several tracks in as few Spotify calls as possible"""
+    identifiers = request.args.getlist('id')
+    for ids in request.args.getlist('ids'):
+        identifiers.extend(ids.split(','))
+    
+    track_ids = list(dict.fromkeys(
+        extract_track_id(identifier.strip()) for identifier in identifiers if identifier.strip()
+    ))
+    if not track_ids:
+        return jsonify({"error": "Query parameter 'ids' is required"}), 400
+    if len(track_ids) > MAX_BATCH_IDS:
+        return jsonify({"error": f"At most {MAX_BATCH_IDS} track IDs per request"}), 400
+    if None in track_ids:
+        return jsonify({"error": "Invalid track ID"}), 400
+    
+    features = batch_features(track_ids)
+    if features is None:
+        return jsonify({"error": "Failed to fetch audio features"}), 500
+    
+    return jsonify({"audio_features": features})
+
 @app.route('/search', methods=['GET'])
 def search_tracks():
     """Search for tracks"""
@@ -217,37 +658,39 @@ def search_tracks():
     
     limit = min(int(request.args.get('limit', 10)), 50)  # Max 50
     
-    endpoint = f"search?q={query}&type=track&limit={limit}"
+    endpoint = "search?" + urlencode({"q": query, "type": "track", "limit": limit})
     data = make_spotify_request(endpoint)
     
     if not data:
         return jsonify({"error": "Failed to search tracks"}), 500
     
-    # Simplify the response
-    tracks = []
-    for item in data["tracks"]["items"]:
-        tracks.append({
-            "id": item["id"],
-            "name": item["name"],
-            "artists": [artist["name"] for artist in item["artists"]],
-            "album": item["album"]["name"],
-            "popularity": item["popularity"],
-            "preview_url": item.get("preview_url"),
-            "external_urls": item["external_urls"]
-        })
-    
-    return jsonify({
-        "tracks": tracks,
-        "total": data["tracks"]["total"]
-    })
+    # Simplify the response in a single pass and serialize it directly
+    results = data["tracks"]
+    payload = {
+        "tracks": [
+            {
+                "id": item["id"],
+                "name": item["name"],
+                "artists": [artist["name"] for artist in item["artists"]],
+                "album": item["album"]["name"],
+                "popularity": item["popularity"],
+                "preview_url": item.get("preview_url"),
+                "external_urls": item["external_urls"]
+            }
+            for item in results["items"]
+        ],
+        "total": results["total"]
+    }
+    
+    return Response(orjson.dumps(payload), mimetype='application/json')
 
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({"error": "Endpoint not found"}), 404
+    return Response(NOT_FOUND_BODY, status=404, mimetype='application/json')
 
 @app.errorhandler(500)
 def internal_error(error):
-    return jsonify({"error": "Internal server error"}), 500
+    return Response(INTERNAL_ERROR_BODY, status=500, mimetype='application/json')
 
 if __name__ == '__main__':
     # Check for required environment variables
@@ -260,16 +703,27 @@ if __name__ == '__main__':
         print("\nStarting server anyway for testing...")
     
     print("🎵 Starting Spotify Audio Features API...")
-    print("📖 Visit http://localhost:5000 for API documentation")
-    print("🔍 Example: http://localhost:5000/features/4iV5W9uYEdYUVa79Axb7Rh")
+    # Same default as the bind in gunicorn.conf.py
+    port = os.getenv('PORT', 5050)
+    print(f"📖 Visit http://localhost:{port} for API documentation")
+    print(f"🔍 Example: http://localhost:{port}/features/4iV5W9uYEdYUVa79Axb7Rh")
     
     # Install required packages if not already installed
     try:
-        import flask
-        import requests
+        import gunicorn
     except ImportError:
         print("\n📦 Install required packages with:")
-        print("pip install flask requests")
+        print("pip install flask flask-compress brotli requests redis orjson ijson python-dotenv gunicorn")
         exit(1)
     
-    app.run(debug=True, host='0.0.0.0', port=5050)
\ No newline at end of file
+    # Serve through gunicorn (threaded workers) rather than the single-threaded dev server.
+    # Run it with this interpreter so it's the same install the import check saw,
+    # and resolve the config and module from this file's directory, not the cwd
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.stdout.flush()  # exec discards anything still buffered
+    os.execv(sys.executable, [
+        sys.executable, "-m", "gunicorn",
+        "--chdir", base_dir,
+        "-c", os.path.join(base_dir, "gunicorn.conf.py"),
+        "spotify_backend:app"
+    ])